@@ -1,9 +1,21 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
 import ast
+import csv
+import io
 from datetime import datetime
 import os
+import re
+import threading
+import time
+import weakref
+
+try:
+    from orjson import loads as json_loads  # C parser, much faster than ast
+except ImportError:
+    json_loads = json.loads
 
 # Set page config
 st.set_page_config(
@@ -12,115 +24,347 @@ st.set_page_config(
     layout="wide"
 )
 
+FEEDBACK_FILE = 'feedback.csv'  # append-only vote log
+FEEDBACK_SNAPSHOT_FILE = 'feedback.parquet'  # compacted votes
+FEEDBACK_COMPACTING_FILE = FEEDBACK_FILE + '.compacting'  # log being folded into the snapshot
+FEEDBACK_COLUMNS = ['MUDID', 'Product_ID', 'Feedback']
+FEEDBACK_DTYPES = {'MUDID': 'category', 'Feedback': 'int8'}
+FLUSH_MAX_PENDING = 20  # votes buffered before forcing a write
+FLUSH_INTERVAL_SECONDS = 30
+
+# Uploads and feedback files replaced over time are not kept cached forever
+CACHE_MAX_ENTRIES = 2
+
+# Rank, product, final, RF, CF, thumbs up, thumbs down
+ROW_COLUMN_WIDTHS = [0.5, 1.5, 1, 1, 1, 0.75, 0.75]
+
+# Phrases that signal a recommendation request without a user ID
+REQUEST_PATTERN_RE = re.compile(r'recommend|suggestion|show|get|find|what|give me')
+
+# Word tokens in free text, looked up directly against user IDs
+WORD_RE = re.compile(r'\w+')
+
+class SessionMarker:
+    """Weak-referenceable object stored in session state; collected when the session ends"""
+
+def flush_orphaned_votes(pending):
+    """Write a finished session's unflushed votes (session expiry or server shutdown)"""
+    if pending:
+        append_feedback_rows(pending)
+        pending.clear()
+
+@st.cache_resource
+def feedback_file_lock():
+    """Process-wide lock around every write to and compaction of the feedback files"""
+    return threading.RLock()
+
 # Initialize session state
-if 'feedback_data' not in st.session_state:
-    st.session_state.feedback_data = []
+if 'pending_feedback' not in st.session_state:
+    st.session_state.pending_feedback = []  # (MUDID, Product_ID, Feedback) rows not yet on disk
+    # Runs when the session is collected, or at interpreter exit if it is still alive
+    st.session_state.session_marker = SessionMarker()
+    weakref.finalize(st.session_state.session_marker, flush_orphaned_votes, st.session_state.pending_feedback)
+    st.session_state.last_flush = time.time()
+    st.session_state.feedback_version = 0  # bumped on every vote
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def _load_from_bytes(data):
+    """Parse uploaded CSV bytes (cached by content across reruns)"""
+    return pd.read_csv(io.BytesIO(data))
+
+@st.cache_data(show_spinner=False)
+def _load_sample_data():
+    """Create sample data based on your example for demonstration"""
+    sample_data = {
+        'MUDID': ['ai730048'],
+        'Recommended_Product': [str([152415, 101115, 222273, 100161, 222453, 100349, 209207])],
+        'Final_Score': [str([0.8, 0.11, 0.11, 0.11, 0.11, 0.11, 0.11])],
+        'RF_Score': [str([0.35, 0.35, 0.35, 0.35, 0.35, 0.35, 0.35])],
+        'CF_Score': [str([1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])],
+        'Visited_Studies': [str(['152415'])],
+        'SHAP': [str([{152415: [{'feature': 'user_ACCOUNT_ACTIVE_Y', 'value': 0.0, 'impact': 0.05}]}])]
+    }
+    return pd.DataFrame(sample_data)
 
 def load_data(uploaded_file=None):
     """Load recommendation data from uploaded file or create sample data"""
     if uploaded_file is not None:
         try:
-            df = pd.read_csv(uploaded_file)
-            return df
+            return _load_from_bytes(uploaded_file.getvalue())
         except Exception as e:
             st.error(f"Error loading file: {str(e)}")
             return None
     else:
-        # Create sample data based on your example for demonstration
-        sample_data = {
-            'MUDID': ['ai730048'],
-            'Recommended_Product': [str([152415, 101115, 222273, 100161, 222453, 100349, 209207])],
-            'Final_Score': [str([0.8, 0.11, 0.11, 0.11, 0.11, 0.11, 0.11])],
-            'RF_Score': [str([0.35, 0.35, 0.35, 0.35, 0.35, 0.35, 0.35])],
-            'CF_Score': [str([1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0])],
-            'Visited_Studies': [str(['152415'])],
-            'SHAP': [str([{152415: [{'feature': 'user_ACCOUNT_ACTIVE_Y', 'value': 0.0, 'impact': 0.05}]}])]
-        }
-        df = pd.DataFrame(sample_data)
-        return df
+        return _load_sample_data()
 
 def parse_list_string(list_str):
     """Safely parse string representation of list"""
+    # JSON covers numeric lists; Python literals (quoted strings etc.) fall back to ast
+    try:
+        return json_loads(list_str)
+    except (ValueError, TypeError):
+        pass
     try:
         return ast.literal_eval(list_str)
     except:
         return []
 
-def save_feedback(user_id, product_id, feedback):
-    """Save or update feedback to CSV file (latest vote only)"""
-    feedback_entry = {
-        'MUDID': user_id,
-        'Product_ID': product_id,
-        'Feedback': feedback  # 1 for thumbs up, -1 for thumbs down, 0 to remove vote
+def parse_shap_string(shap_str):
+    """Safely parse SHAP column string into a {product_id: features} map"""
+    try:
+        shap_list = json_loads(shap_str)
+    except (ValueError, TypeError):
+        # Python-repr SHAP fails at its first single quote, so this costs little; go straight to ast
+        try:
+            shap_list = ast.literal_eval(shap_str)
+        except:
+            return {}
+    
+    # Flatten the list of per-product dicts; first entry for a product wins
+    shap_map = {}
+    try:
+        for shap_dict in shap_list:
+            for product_id, features in shap_dict.items():
+                shap_map.setdefault(product_id, features)
+    except (TypeError, AttributeError):
+        return {}
+    return shap_map
+
+def align_shap_keys(shap_map, product_ids):
+    """Re-key a SHAP map by the product IDs as typed in Recommended_Product"""
+    # JSON object keys are always strings while product lists may hold ints, so match on str()
+    by_str = {}
+    for product_id, features in shap_map.items():
+        by_str.setdefault(str(product_id), features)
+    return {
+        product_id: by_str[str(product_id)]
+        for product_id in product_ids
+        if str(product_id) in by_str
     }
+
+LIST_COLUMNS = ['Recommended_Product', 'Final_Score', 'RF_Score', 'CF_Score']
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def preprocess(data_key, _raw_df):
+    """Parse list/SHAP string columns once per loaded file (shared, treat as read-only)"""
+    df = _raw_df.copy()
+    for col in LIST_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(parse_list_string)
+    if 'SHAP' in df.columns:
+        df['SHAP'] = df['SHAP'].map(parse_shap_string)
+    # Unique hash index on MUDID for per-user lookups (first row per user wins)
+    df = df[~df['MUDID'].duplicated()]
+    if 'SHAP' in df.columns and 'Recommended_Product' in df.columns:
+        df['SHAP'] = [
+            align_shap_keys(shap_map, product_ids)
+            for shap_map, product_ids in zip(df['SHAP'], df['Recommended_Product'])
+        ]
+    return df.set_index('MUDID', drop=False)
+
+def score_markers(final_scores):
+    """Color marker per final score, computed over the whole list at once"""
+    final_arr = np.asarray(final_scores, dtype=float)
+    return np.select([final_arr >= 0.7, final_arr >= 0.4], ["🟢", "🟡"], default="🔴")
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def build_user_index(data_key, _raw_df):
+    """Map each MUDID to its product records (ID, scores, marker), built once per file"""
+    df = preprocess(data_key, _raw_df)
+    return {
+        row.MUDID: [
+            {'pid': pid, 'final': final, 'rf': rf, 'cf': cf, 'color': color}
+            for pid, final, rf, cf, color in zip(
+                row.Recommended_Product, row.Final_Score, row.RF_Score, row.CF_Score,
+                score_markers(row.Final_Score)
+            )
+        ]
+        for row in df.itertuples(index=False)
+    }
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_available_users(data_key, _mudids):
+    """Unique user IDs in file order"""
+    return _mudids.unique().tolist()
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def get_user_search_index(data_key, _mudids):
+    """Unique user IDs alongside their lowercased form for sidebar search"""
+    users = pd.Series(_mudids.unique())
+    return users, users.astype('string').str.lower()
+
+def save_feedback(user_id, product_id, feedback):
+    """Record vote in session state; written to the feedback log in batches"""
+    # 1 for thumbs up, -1 for thumbs down, 0 to remove vote
+    st.session_state.pending_feedback.append((user_id, product_id, feedback))
+    st.session_state.feedback_version += 1
+    
+    # Keep in-memory vote index in sync with the log
+    if feedback == 0:
+        st.session_state.vote_idx.pop((user_id, product_id), None)
+    else:
+        st.session_state.vote_idx[(user_id, product_id)] = feedback
     
-    # Load existing feedback or create new
+    # Votes arrive via fragment reruns that skip main(), so apply the flush thresholds here
+    flush_feedback()
+
+def flush_feedback(force=False):
+    """Append buffered votes to the feedback log in a single write"""
+    pending = st.session_state.pending_feedback
+    if not pending:
+        return
+    
+    elapsed = time.time() - st.session_state.last_flush
+    if not force and len(pending) < FLUSH_MAX_PENDING and elapsed < FLUSH_INTERVAL_SECONDS:
+        return
+    
+    append_feedback_rows(pending)
+    pending.clear()
+    st.session_state.last_flush = time.time()
+
+def append_feedback_rows(rows):
+    """Append vote rows to the feedback log in a single write"""
+    # Sessions, finalizers and compaction all touch the log; one writer at a time keeps one header
+    with feedback_file_lock():
+        write_header = not os.path.exists(FEEDBACK_FILE)
+        with open(FEEDBACK_FILE, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(FEEDBACK_COLUMNS)
+            writer.writerows(rows)
+
+def file_signature(path):
+    """(mtime, size) of a file, or None if missing; changes whenever the file does"""
     try:
-        feedback_df = pd.read_csv('feedback.csv')
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def read_feedback_files(snapshot_signature, compacting_signature, log_signature):
+    """Read vote rows from snapshot, log under compaction and log (cached until any file changes)"""
+    frames = []
+    if snapshot_signature is not None:
+        frames.append(pd.read_parquet(FEEDBACK_SNAPSHOT_FILE))
+    if compacting_signature is not None:
+        frames.append(pd.read_csv(FEEDBACK_COMPACTING_FILE))
+    if log_signature is not None:
+        frames.append(pd.read_csv(FEEDBACK_FILE))
+    if not frames:
+        return pd.DataFrame(columns=FEEDBACK_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+def load_feedback():
+    """Load current votes from snapshot, feedback log and unflushed buffer (latest vote only)"""
+    # Held so compaction cannot move or remove a file between its signature and its read
+    with feedback_file_lock():
+        feedback_df = read_feedback_files(
+            file_signature(FEEDBACK_SNAPSHOT_FILE),
+            file_signature(FEEDBACK_COMPACTING_FILE),
+            file_signature(FEEDBACK_FILE),
+        )
+    if st.session_state.pending_feedback:
+        pending_df = pd.DataFrame(st.session_state.pending_feedback, columns=FEEDBACK_COLUMNS)
+        feedback_df = pd.concat([feedback_df, pending_df], ignore_index=True)
+    return latest_votes(feedback_df)
+
+def latest_votes(feedback_df):
+    """Reduce vote rows to the latest non-removed vote per user-product"""
+    feedback_df = feedback_df.groupby(['MUDID', 'Product_ID']).tail(1)
+    feedback_df = feedback_df[feedback_df['Feedback'] != 0]
+    # Votes are ±1 and user IDs repeat across rows, so keep them narrow
+    feedback_df = feedback_df.astype(FEEDBACK_DTYPES)
+    try:
+        feedback_df['Product_ID'] = pd.to_numeric(feedback_df['Product_ID'], downcast='integer')
+    except (ValueError, TypeError):
+        pass  # Non-numeric product IDs stay as they are
+    return feedback_df
+
+def compact_feedback():
+    """Fold feedback log into the Parquet snapshot (latest vote per user-product)"""
+    flush_feedback(force=True)
+    # One compaction at a time; a second Refresh finds the log already folded
+    with feedback_file_lock():
+        # A log left by an interrupted compaction is folded first; the live log waits for the next run
+        if not os.path.exists(FEEDBACK_COMPACTING_FILE):
+            if not os.path.exists(FEEDBACK_FILE):
+                return  # Nothing logged since last compaction
+            # Move the log aside so votes appended meanwhile start a fresh log instead of being deleted
+            os.replace(FEEDBACK_FILE, FEEDBACK_COMPACTING_FILE)
         
-        # Check if this user-product combination exists
-        mask = (feedback_df['MUDID'] == user_id) & (feedback_df['Product_ID'] == product_id)
+        frames = [pd.read_csv(FEEDBACK_COMPACTING_FILE)]
+        if os.path.exists(FEEDBACK_SNAPSHOT_FILE):
+            frames.insert(0, pd.read_parquet(FEEDBACK_SNAPSHOT_FILE))
+        feedback_df = latest_votes(pd.concat(frames, ignore_index=True))
         
-        if mask.any():
-            # Update existing vote
-            if feedback == 0:
-                # Remove vote entirely
-                feedback_df = feedback_df[~mask]
-            else:
-                # Update existing vote
-                feedback_df.loc[mask, 'Feedback'] = feedback
-        else:
-            # Add new vote (only if not removing)
-            if feedback != 0:
-                feedback_df = pd.concat([feedback_df, pd.DataFrame([feedback_entry])], ignore_index=True)
-    
-    except FileNotFoundError:
-        # Create new file (only if not removing)
-        if feedback != 0:
-            feedback_df = pd.DataFrame([feedback_entry])
-        else:
-            feedback_df = pd.DataFrame(columns=['MUDID', 'Product_ID', 'Feedback'])
-    
-    feedback_df.to_csv('feedback.csv', index=False)
+        # Write snapshot before dropping the old log so a crash never loses votes
+        tmp_file = FEEDBACK_SNAPSHOT_FILE + '.tmp'
+        feedback_df.to_parquet(tmp_file, index=False, compression='snappy')
+        os.replace(tmp_file, FEEDBACK_SNAPSHOT_FILE)
+        os.remove(FEEDBACK_COMPACTING_FILE)
+
+def build_vote_index(feedback_df):
+    """Build (MUDID, Product_ID) -> vote lookup from current votes"""
+    keys = zip(feedback_df['MUDID'], feedback_df['Product_ID'])
+    return dict(zip(keys, feedback_df['Feedback']))
+
+def get_user_feedback(feedback_by_user, user_id):
+    """Get current votes for one user from feedback grouped by MUDID"""
+    try:
+        return feedback_by_user.get_group(user_id)
+    except KeyError:
+        return pd.DataFrame(columns=FEEDBACK_COLUMNS)
 
 def get_user_vote(user_id, product_id):
     """Get current vote for user-product pair"""
-    try:
-        feedback_df = pd.read_csv('feedback.csv')
-        mask = (feedback_df['MUDID'] == user_id) & (feedback_df['Product_ID'] == product_id)
-        if mask.any():
-            return feedback_df.loc[mask, 'Feedback'].iloc[0]
-        return 0  # No vote
-    except FileNotFoundError:
-        return 0  # No vote
+    return st.session_state.vote_idx.get((user_id, product_id), 0)  # 0 = no vote
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def build_user_matchers(data_key, _available_users):
+    """Build direct-match regex and 4-character partial index for user IDs"""
+    lower_to_user = {}
+    partial_index = {}
+    for user in _available_users:
+        user_str = str(user).lower()
+        lower_to_user.setdefault(user_str, user)
+        for i in range(len(user_str) - 3):
+            partial_index.setdefault(user_str[i:i+4], user)
+    
+    # Longest IDs first so the alternation prefers full IDs over their prefixes
+    ids = sorted(lower_to_user, key=len, reverse=True)
+    direct_re = re.compile('|'.join(map(re.escape, ids))) if ids else None
+    return direct_re, lower_to_user, partial_index
 
-def extract_user_from_text(text_input, available_users):
+def extract_user_from_text(text_input, available_users, data_key):
     """Extract user ID from natural language text input"""
     if not text_input.strip():
         return None, None
     
     text_lower = text_input.lower().strip()
     
-    # Direct user ID check - look for exact matches
-    for user in available_users:
-        if str(user).lower() in text_lower:
+    direct_re, lower_to_user, partial_index = build_user_matchers(data_key, available_users)
+    
+    # Direct user ID check - whole words first, one dict lookup each
+    for token in WORD_RE.findall(text_lower):
+        if token in lower_to_user:
+            user = lower_to_user[token]
             return user, f"Found user ID: {user}"
     
+    # IDs embedded in longer words or containing punctuation
+    match = direct_re.search(text_lower) if direct_re else None
+    if match:
+        user = lower_to_user[match.group(0)]
+        return user, f"Found user ID: {user}"
+    
     # Look for partial matches (at least 4 characters)
-    for user in available_users:
-        user_str = str(user).lower()
-        if len(user_str) >= 4:
-            for i in range(len(user_str) - 3):
-                substring = user_str[i:i+4]
-                if substring in text_lower:
-                    return user, f"Matched partial ID: {user}"
+    for i in range(len(text_lower) - 3):
+        user = partial_index.get(text_lower[i:i+4])
+        if user is not None:
+            return user, f"Matched partial ID: {user}"
     
     # Common patterns
-    patterns = [
-        "recommend", "suggestion", "show", "get", "find", "what", "give me"
-    ]
-    
-    if any(pattern in text_lower for pattern in patterns):
+    if REQUEST_PATTERN_RE.search(text_lower):
         return None, "I understand you want recommendations, but I need a user ID. Try including a user ID in your request or use the dropdown below."
     
     # Build available users sample
@@ -130,31 +374,105 @@ def extract_user_from_text(text_input, available_users):
     
     return None, f"I couldn't find a matching user ID in your request. Available users: {available_sample}"
 
-def display_shap_explanation(shap_data, product_id):
+def display_shap_explanation(shap_map, product_id):
     """Display SHAP explanation for a product"""
+    if not shap_map:
+        st.write("No detailed explanation available")
+        return
+    
+    features = shap_map.get(product_id)
+    if features is None:
+        st.write("No detailed explanation available")
+        return
+    
     try:
-        shap_list = ast.literal_eval(shap_data)
-        for shap_dict in shap_list:
-            if product_id in shap_dict:
-                features = shap_dict[product_id]
-                
-                st.write("**Feature Explanations:**")
-                for feature in features[:3]:  # Show top 3 features
-                    impact = feature.get('impact', 0)
-                    feature_name = feature.get('feature', 'Unknown')
-                    value = feature.get('value', 0)
-                    
-                    # Color code based on impact
-                    color = "green" if impact > 0.02 else "orange" if impact > 0.01 else "red"
-                    st.write(f"- **{feature_name}**: Impact {impact:.3f} ::{color}[●]")
-                break
+        st.write("**Feature Explanations:**")
+        for feature in features[:3]:  # Show top 3 features
+            impact = feature.get('impact', 0)
+            feature_name = feature.get('feature', 'Unknown')
+            value = feature.get('value', 0)
+            
+            # Color code based on impact
+            color = "green" if impact > 0.02 else "orange" if impact > 0.01 else "red"
+            st.write(f"- **{feature_name}**: Impact {impact:.3f} ::{color}[●]")
     except:
         st.write("No detailed explanation available")
 
+@st.fragment
+def render_product_row(user_input, rank, product_id, final_score, rf_score, cf_score, score_color):
+    """Render one recommendation row; a vote reruns only this fragment"""
+    # Create inline display with columns
+    col_rank, col_product, col_final, col_rf, col_cf, col_up, col_down = st.columns(ROW_COLUMN_WIDTHS)
+    
+    with col_rank:
+        st.write(f"**#{rank}**")
+    
+    with col_product:
+        st.write(f"**Product {product_id}**")
+    
+    with col_final:
+        st.write(f"{score_color} {final_score:.3f}")
+    
+    with col_rf:
+        st.write(f"{rf_score:.3f}")
+    
+    with col_cf:
+        st.write(f"{cf_score:.3f}")
+    
+    # Get current vote status
+    current_vote = get_user_vote(user_input, product_id)
+    
+    with col_up:
+        # Determine button style based on current vote
+        if current_vote == 1:
+            button_type = "primary"
+            button_text = "👍"
+        else:
+            button_type = "secondary"
+            button_text = "👍"
+        
+        # Toggle logic: if already liked, remove vote; otherwise set to like
+        new_vote = 0 if current_vote == 1 else 1
+        st.button(button_text, key=f"up_{product_id}", help="Like this recommendation", 
+                  type=button_type, use_container_width=True,
+                  on_click=save_feedback, args=(user_input, product_id, new_vote))
+    
+    with col_down:
+        # Determine button style based on current vote
+        if current_vote == -1:
+            button_type = "primary"
+            button_text = "👎"
+        else:
+            button_type = "secondary" 
+            button_text = "👎"
+        
+        # Toggle logic: if already disliked, remove vote; otherwise set to dislike
+        new_vote = 0 if current_vote == -1 else -1
+        st.button(button_text, key=f"down_{product_id}", help="Dislike this recommendation", 
+                  type=button_type, use_container_width=True,
+                  on_click=save_feedback, args=(user_input, product_id, new_vote))
+
 def main():
     st.title("🎯 Product Recommendation System")
     st.markdown("---")
     
+    flush_feedback()
+    
+    # Rebuild current votes only after a vote or a change on disk; all panels share this frame
+    feedback_key = (
+        st.session_state.feedback_version,
+        file_signature(FEEDBACK_SNAPSHOT_FILE),
+        file_signature(FEEDBACK_COMPACTING_FILE),
+        file_signature(FEEDBACK_FILE),
+    )
+    if st.session_state.get('feedback_key') != feedback_key:
+        st.session_state.feedback_df = load_feedback()
+        st.session_state.feedback_by_user = st.session_state.feedback_df.groupby('MUDID', sort=False, observed=True)
+        # Rebuilt too so votes other sessions wrote show on the buttons (pending votes are included)
+        st.session_state.vote_idx = build_vote_index(st.session_state.feedback_df)
+        st.session_state.feedback_key = feedback_key
+    feedback_by_user = st.session_state.feedback_by_user
+    
     # File upload section
     st.header("📁 Upload Recommendation Data")
     uploaded_file = st.file_uploader(
@@ -164,11 +482,16 @@ def main():
     )
     
     # Load data
-    df = load_data(uploaded_file)
+    raw_df = load_data(uploaded_file)
     
-    if df is None:
+    if raw_df is None:
         st.stop()
     
+    # Derived caches are keyed on the upload itself; hashing the frame is slow and samples large ones
+    data_key = uploaded_file.file_id if uploaded_file is not None else 'sample'
+    df = preprocess(data_key, raw_df)
+    user_index = build_user_index(data_key, raw_df)
+    
     # Display file info
     if uploaded_file is not None:
         st.success(f"✅ File uploaded successfully: {uploaded_file.name}")
@@ -178,7 +501,7 @@ def main():
     
     # Show data preview
     with st.expander("📋 Preview Data Structure", expanded=False):
-        st.dataframe(df.head(2), use_container_width=True)
+        st.dataframe(raw_df.head(2), use_container_width=True)
         st.write("**Columns:**", list(df.columns))
     
     st.markdown("---")
@@ -195,12 +518,12 @@ def main():
     )
     
     # Process text input
-    available_users = df['MUDID'].unique().tolist()
+    available_users = get_available_users(data_key, df['MUDID'])
     selected_user_from_text = None
     text_feedback = None
     
     if text_query.strip():
-        selected_user_from_text, text_feedback = extract_user_from_text(text_query, available_users)
+        selected_user_from_text, text_feedback = extract_user_from_text(text_query, available_users, data_key)
         
         if selected_user_from_text:
             st.sidebar.success(text_feedback)
@@ -215,7 +538,9 @@ def main():
     
     # Filter users based on search
     if user_search:
-        filtered_users = [user for user in available_users if user_search.lower() in str(user).lower()]
+        users, users_lower = get_user_search_index(data_key, df['MUDID'])
+        matches = users_lower.str.contains(user_search.lower(), regex=False, na=False)
+        filtered_users = users[matches].tolist()
     else:
         filtered_users = available_users
     
@@ -258,23 +583,18 @@ def main():
         st.header(f"Recommendations for User: {user_input}")
         
         # Check if user exists in data
-        user_data = df[df['MUDID'] == user_input]
+        products = user_index.get(user_input)
         
-        if user_data.empty:
+        if products is None:
             st.warning(f"No recommendations found for user {user_input}")
         else:
-            # Get user's recommendations
-            user_row = user_data.iloc[0]
-            recommended_products = parse_list_string(user_row['Recommended_Product'])
-            final_scores = parse_list_string(user_row['Final_Score'])
-            rf_scores = parse_list_string(user_row['RF_Score'])
-            cf_scores = parse_list_string(user_row['CF_Score'])
-            
-            total_products = len(recommended_products)
+            total_products = len(products)
             st.info(f"📦 Found {total_products} recommendations")
             
             # Add column headers
-            header_col1, header_col2, header_col3, header_col4, header_col5, header_col6 = st.columns([0.5, 1.5, 1, 1, 1, 1.5])
+            header_col1, header_col2, header_col3, header_col4, header_col5, header_col6 = st.columns(
+                ROW_COLUMN_WIDTHS[:5] + [sum(ROW_COLUMN_WIDTHS[5:])]  # feedback header spans both buttons
+            )
             
             with header_col1:
                 st.write("**Rank**")
@@ -291,137 +611,88 @@ def main():
             
             st.divider()
             
+            shap_map = df.at[user_input, 'SHAP']
+            
             # Display recommendations inline
-            for i, product_id in enumerate(recommended_products):
-                # Create inline display with columns
-                col_rank, col_product, col_final, col_rf, col_cf, col_thumbs = st.columns([0.5, 1.5, 1, 1, 1, 1.5])
-                
-                with col_rank:
-                    st.write(f"**#{i+1}**")
-                
-                with col_product:
-                    st.write(f"**Product {product_id}**")
-                
-                with col_final:
-                    score_color = "🟢" if final_scores[i] >= 0.7 else "🟡" if final_scores[i] >= 0.4 else "🔴"
-                    st.write(f"{score_color} {final_scores[i]:.3f}")
-                
-                with col_rf:
-                    st.write(f"{rf_scores[i]:.3f}")
-                
-                with col_cf:
-                    st.write(f"{cf_scores[i]:.3f}")
-                
-                with col_thumbs:
-                    thumb_col1, thumb_col2 = st.columns(2)
-                    
-                    # Get current vote status
-                    current_vote = get_user_vote(user_input, product_id)
-                    
-                    with thumb_col1:
-                        # Determine button style based on current vote
-                        if current_vote == 1:
-                            button_type = "primary"
-                            button_text = "👍"
-                        else:
-                            button_type = "secondary"
-                            button_text = "👍"
-                        
-                        if st.button(button_text, key=f"up_{product_id}", help="Like this recommendation", 
-                                   type=button_type, use_container_width=True):
-                            # Toggle logic: if already liked, remove vote; otherwise set to like
-                            new_vote = 0 if current_vote == 1 else 1
-                            save_feedback(user_input, product_id, new_vote)
-                            st.rerun()
-                    
-                    with thumb_col2:
-                        # Determine button style based on current vote
-                        if current_vote == -1:
-                            button_type = "primary"
-                            button_text = "👎"
-                        else:
-                            button_type = "secondary" 
-                            button_text = "👎"
-                        
-                        if st.button(button_text, key=f"down_{product_id}", help="Dislike this recommendation", 
-                                   type=button_type, use_container_width=True):
-                            # Toggle logic: if already disliked, remove vote; otherwise set to dislike
-                            new_vote = 0 if current_vote == -1 else -1
-                            save_feedback(user_input, product_id, new_vote)
-                            st.rerun()
+            for i, product in enumerate(products):
+                product_id = product['pid']
+                render_product_row(
+                    user_input, i + 1, product_id,
+                    product['final'], product['rf'], product['cf'], product['color']
+                )
                 
                 # Add SHAP explanation in a subtle way
                 if i < 3:  # Show SHAP for top 3 only to avoid clutter
-                    with st.expander(f"🔍 Why Product {product_id}?", expanded=False):
-                        display_shap_explanation(user_row['SHAP'], product_id)
+                    # Unlike an expander body, this only runs while the toggle is on
+                    if st.toggle(f"🔍 Why Product {product_id}?", key=f"why_{product_id}"):
+                        display_shap_explanation(shap_map, product_id)
                 
                 # Add separator between products
-                if i < len(recommended_products) - 1:
+                if i < total_products - 1:
                     st.divider()
     
     with col2:
         st.header("📊 Your Feedback")
         
         # Load and display user-specific feedback stats
-        try:
-            feedback_df = pd.read_csv('feedback.csv')
-            user_feedback = feedback_df[feedback_df['MUDID'] == user_input]
+        user_feedback = get_user_feedback(feedback_by_user, user_input)
+        
+        if not user_feedback.empty:
+            st.write("**Your Recent Votes:**")
+            
+            # Show recent votes with product info
+            for _, row in user_feedback.tail(5).iterrows():
+                emoji = "👍" if row['Feedback'] == 1 else "👎"
+                st.write(f"{emoji} Product {row['Product_ID']}")
+            
+            # User-specific stats
+            st.write("**Your Statistics:**")
+            vote_counts = user_feedback['Feedback'].value_counts()
+            positive_votes = int(vote_counts.get(1, 0))
+            negative_votes = int(vote_counts.get(-1, 0))
+            total_votes = int(vote_counts.sum())
+            
+            st.metric("Total Votes", total_votes)
+            col_pos, col_neg = st.columns(2)
+            with col_pos:
+                st.metric("👍 Likes", positive_votes)
+            with col_neg:
+                st.metric("👎 Dislikes", negative_votes)
+            
+            if total_votes > 0:
+                satisfaction_rate = (positive_votes / total_votes) * 100
+                st.metric("Your Satisfaction", f"{satisfaction_rate:.0f}%")
+        else:
+            st.info("No votes yet. Start rating recommendations!")
             
-            if not user_feedback.empty:
-                st.write("**Your Recent Votes:**")
-                
-                # Show recent votes with product info
-                for _, row in user_feedback.tail(5).iterrows():
-                    emoji = "👍" if row['Feedback'] == 1 else "👎"
-                    st.write(f"{emoji} Product {row['Product_ID']}")
-                
-                # User-specific stats
-                st.write("**Your Statistics:**")
-                total_votes = len(user_feedback)
-                positive_votes = len(user_feedback[user_feedback['Feedback'] == 1])
-                negative_votes = len(user_feedback[user_feedback['Feedback'] == -1])
-                
-                st.metric("Total Votes", total_votes)
-                col_pos, col_neg = st.columns(2)
-                with col_pos:
-                    st.metric("👍 Likes", positive_votes)
-                with col_neg:
-                    st.metric("👎 Dislikes", negative_votes)
-                
-                if total_votes > 0:
-                    satisfaction_rate = (positive_votes / total_votes) * 100
-                    st.metric("Your Satisfaction", f"{satisfaction_rate:.0f}%")
-            else:
-                st.info("No votes yet. Start rating recommendations!")
-                
-        except FileNotFoundError:
-            st.info("No feedback data available yet")
     
     # Footer
     st.markdown("---")
     st.markdown("### Data Management")
     
-    col_x, col_y = st.columns(2)
+    col_x, col_y, col_z = st.columns(3)
     
     with col_x:
         if st.button("📥 Download Your Feedback"):
-            try:
-                feedback_df = pd.read_csv('feedback.csv')
-                user_feedback = feedback_df[feedback_df['MUDID'] == user_input]
-                if not user_feedback.empty:
-                    st.download_button(
-                        label="Download Your Data",
-                        data=user_feedback.to_csv(index=False),
-                        file_name=f"feedback_{user_input}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv"
-                    )
-                else:
-                    st.warning("No feedback data to download for this user")
-            except FileNotFoundError:
-                st.warning("No feedback data to download")
+            user_feedback = get_user_feedback(feedback_by_user, user_input)
+            if not user_feedback.empty:
+                st.download_button(
+                    label="Download Your Data",
+                    data=user_feedback.to_csv(index=False),
+                    file_name=f"feedback_{user_input}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv"
+                )
+            else:
+                st.warning("No feedback data to download for this user")
     
     with col_y:
+        if st.button("💾 Persist Feedback", help="Write votes not yet saved to disk now"):
+            flush_feedback(force=True)
+            st.success("Feedback saved")
+    
+    with col_z:
         if st.button("🔄 Refresh Data"):
+            compact_feedback()
             st.rerun()
 
 if __name__ == "__main__":